@@ -1,78 +1,244 @@
+import numpy as np
 import pandas as pd
 import pyomo.environ as pyo
-import math
+from pyomo.core.expr.numeric_expr import LinearExpression
+from pyomo.contrib.appsi.base import TerminationCondition
+from pyomo.contrib.appsi.solvers import Highs
+import functools
+import importlib.util
 import os
+import pickle
 
 
-# Create a concrete PyOmo model instance
-model = pyo.ConcreteModel(name="Retail_Store_Location")
+# Arbitrary number of new stores that we would want to open
+P_max = 5
 
-# Locations with customer demand that dont have stores
-customer_demand = pd.read_csv('data/RetailStores-Set I.csv', skiprows=1, header=None, usecols=[0])[0].tolist()
-# Potential locations of new stores
-potential_new_stores = pd.read_csv('data/RetailStores-Set J.csv', skiprows=1, header=None, usecols=[0])[0].tolist()
-# List of existing stores
-all_existing_locations = pd.read_csv('data/RetailStores-Set M.csv', skiprows=1, header=None, usecols=[0])[0].tolist()
-# Customer demographics
-demographics = pd.read_csv('data/RetailStores-Set S.csv', skiprows=1, header=None, usecols=[0])[0].tolist()
+# The only constraint is the store budget and every w is >= 0, so the best answer is just the P_max stores with the largest w.
+# Flip this on to build the pyomo model and solve it with HiGHS instead, e.g. once more constraints get added
+USE_SOLVER = False
 
-# h_is: i = demand location, s = customer segment, value = quantity
-# d_ij: i = demand location, j = store location, value = distance
-# v_j=0: i = demand location, value = customer choosing shopping experience not at the store (could go to competitors or online, large negative = more likely to choose in store. At or near 0 means likely to choose alternative options)
-h_is = pd.read_csv('data/RetailStores-h_is.csv', skiprows=1, names=['i', 's', 'value']).set_index(['i', 's'])['value'].to_dict()
-d_ij = pd.read_csv('data/RetailStores-d_ij.csv', skiprows=1, names=['i', 'j', 'value']).set_index(['i', 'j'])['value'].to_dict()
-v_j0 = pd.read_csv('data/RetailStores-V_j=0.csv', skiprows=2, names=['i', 'value']).set_index('i')['value'].to_dict()
 
-existing_stores = [j for j in all_existing_locations if str(j).startswith('E')]
-competitor_stores = [j for j in all_existing_locations if str(j).startswith('C')]
-potential_new_locations = [j for j in all_existing_locations if str(j).startswith('P')]
+# pyarrow parses csvs a lot faster than the default engine, but it isnt in requirements.txt so only use it if it's installed
+CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
 
-# Categories in the data
-model.I = pyo.Set(initialize=customer_demand)
-model.J = pyo.Set(initialize=potential_new_stores)
-model.S = pyo.Set(initialize=demographics)
-model.E = pyo.Set(initialize=existing_stores)
-model.C = pyo.Set(initialize=competitor_stores)
-model.P = pyo.Set(initialize=potential_new_locations)
+# Once d has this many entries the weights are computed with numba (if it's installed) instead of numpy
+# numba isnt in requirements.txt either, and importing it is slow, so it's only imported once an instance this big shows up
+NUMBA_MIN_SIZE = 1_000_000
 
-# Category data
-model.h = pyo.Param(model.I, model.S, initialize=h_is, default=0)
-model.d = pyo.Param(model.I, model.P | model.E | model.C, initialize=d_ij, default=1e6)
-model.v0 = pyo.Param(model.I, initialize=v_j0, default=0)
-model.P_max = pyo.Param(initialize=5, doc="Maximum number of new stores to open") # Arbitrary number of new stores that we would want to open
 
-# Model is told to make decisions about new store locations using a binary system (1 = build store, 0 = dont build store)
-model.x = pyo.Var(model.P, within=pyo.Binary)
+# Loads csv_path with load_csv, caching the result in csv_path + '.<pandas version>.<csv engine>.pkl'
+# The cache is only used if it is newer than the csv and this script (which holds the parsing code), otherwise the csv is re-read and the cache rewritten
+# A pickled DataFrame only loads back reliably with the pandas that wrote it, and with the pyarrow engine the categoricals
+# need pyarrow to unpickle, so both are part of the file name (a pyarrow cache is never loaded where pyarrow is missing),
+# and if the cache still cant be loaded for any reason it's just treated as missing
+def load_cached(csv_path, load_csv):
+    cache_path = f'{csv_path}.{pd.__version__}.{CSV_ENGINE}.pkl'
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) > max(os.path.getmtime(csv_path), os.path.getmtime(__file__)):
+        try:
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            pass
+    data = load_csv(csv_path)
+    with open(cache_path, 'wb') as f:
+        pickle.dump(data, f)
+    return data
+
+
+# Turns a long table (one row per row_col, col_col, value) into a dense rows x cols array
+# Every cell starts at fill and the csv values are written in with one vectorized scatter, anything not in rows/cols is dropped
+def scatter_to_dense(df, row_col, col_col, rows, cols, fill):
+    row_idx = pd.Index(rows).get_indexer(df[row_col])
+    col_idx = pd.Index(cols).get_indexer(df[col_col])
+    keep = (row_idx >= 0) & (col_idx >= 0)
+    dense = np.full((len(rows), len(cols)), fill, dtype=float)
+    dense[row_idx[keep], col_idx[keep]] = df['value'].to_numpy(dtype=float)[keep]
+    return dense
+
+
+# Reads everything out of the data folder and returns it as a dict
+def load_data():
+    # Locations with customer demand that dont have stores
+    customer_demand = pd.read_csv('data/RetailStores-Set I.csv', skiprows=1, header=None, usecols=[0], engine=CSV_ENGINE)[0].tolist()
+    # Potential locations of new stores
+    potential_new_stores = pd.read_csv('data/RetailStores-Set J.csv', skiprows=1, header=None, usecols=[0], engine=CSV_ENGINE)[0].tolist()
+    # List of existing stores
+    all_existing_locations = pd.read_csv('data/RetailStores-Set M.csv', skiprows=1, header=None, usecols=[0], engine=CSV_ENGINE)[0].tolist()
+    # Customer demographics
+    demographics = pd.read_csv('data/RetailStores-Set S.csv', skiprows=1, header=None, usecols=[0], engine=CSV_ENGINE)[0].tolist()
+
+    # h_is: i = demand location, s = customer segment, value = quantity
+    # d_ij: i = demand location, j = store location, value = distance
+    # v_j=0 isnt read since the simplified objective doesnt use it: i = demand location, value = customer choosing shopping experience not at the store (could go to competitors or online, large negative = more likely to choose in store. At or near 0 means likely to choose alternative options)
+    # Parsing is the slow part, so the parsed table is pickled next to the csv and reused until the csv or this script changes
+    h_is = load_cached('data/RetailStores-h_is.csv', lambda path: pd.read_csv(path, skiprows=1, names=['i', 's', 'value'], dtype={'i': 'int32', 's': 'category', 'value': 'float64'}, engine=CSV_ENGINE))
+    d_ij = load_cached('data/RetailStores-d_ij.csv', lambda path: pd.read_csv(path, skiprows=1, names=['i', 'j', 'value'], dtype={'i': 'int32', 'j': 'category', 'value': 'float64'}, engine=CSV_ENGINE))
+
+    # Split Set M by the first letter of the id in one pass (E = existing, C = competitor, P = potential)
+    existing_stores, competitor_stores, potential_new_locations = [], [], []
+    store_types = {'E': existing_stores, 'C': competitor_stores, 'P': potential_new_locations}
+    for j in all_existing_locations:
+        store_list = store_types.get(str(j)[:1])
+        if store_list is not None:
+            store_list.append(j)
+
+    # Dense h and d arrays (missing h = 0 demand, missing d = 1e6 so it contributes basically nothing)
+    # rows = demand locations (I), columns = customer segments (S) / potential new stores (P)
+    h_arr = scatter_to_dense(h_is, 'i', 's', customer_demand, demographics, 0.0)
+    d_arr = scatter_to_dense(d_ij, 'i', 'j', customer_demand, potential_new_locations, 1e6)
+
+    return {
+        'customer_demand': customer_demand,
+        'potential_new_stores': potential_new_stores,
+        'demographics': demographics,
+        'existing_stores': existing_stores,
+        'competitor_stores': competitor_stores,
+        'potential_new_locations': potential_new_locations,
+        'h': h_arr,
+        'd': d_arr,
+    }
+
+
+# Imports numba and builds the weights kernel the first time it's needed, returns None if numba isnt installed
+@functools.lru_cache(maxsize=None)
+def _numba_weights_kernel():
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    # Same math as the numpy version, but the divide and the sum happen in one pass so 1/d never gets stored,
+    # and the potential stores are split across threads. cache=True keeps the compiled version between runs
+    @njit(parallel=True, fastmath=True, cache=True)
+    def compute_weights_numba(H_i, d_arr):
+        n_I, n_P = d_arr.shape
+        w = np.zeros(n_P)
+        for j in prange(n_P):
+            acc = 0.0
+            for i in range(n_I):
+                acc += H_i[i] / d_arr[i, j]
+            w[j] = acc
+        return w
+    return compute_weights_numba
 
 
 # Claude built this, I didnt want to do the math
-# The idea here is that the total_captured_demand is a score that tells us how many new customers will be gained by opening this store
-def objective_rule(model):
-    # Simplified objective: Maximize the sum of demand captured by new stores, weighted by inverse distance.
-    # This linearizes the problem, allowing the use of GLPK.
-    total_captured_demand = 0
-    # Loop over the neighborhood
-    for i in model.I:
-        # Loop over the customer type
-        for s in model.S:
-            # Sum of utility from potential new stores, multiplied by demand
-            total_captured_demand += model.h[i,s] * sum(1/model.d[i,j] * model.x[j] for j in model.P)
-    return total_captured_demand
-
-model.objective = pyo.Objective(rule=objective_rule, sense=pyo.maximize)
-
-# Tells the model what the max number of binary values of 1 that we want -- Basically, how many new stores we want to open
-def budget_constraint_rule(model):
-    return sum(model.x[j] for j in model.P) <= model.P_max
-model.budget_constraint = pyo.Constraint(rule=budget_constraint_rule)
-
-
-print("PyOmo model has been built successfully.")
-solver = pyo.SolverFactory('glpk', executable=r'C:\Users\myers\glpk-4.65\w64\glpsol.exe')
-results = solver.solve(model, tee=True)
-
-if (results.solver.status == pyo.SolverStatus.ok) and (results.solver.termination_condition == pyo.TerminationCondition.optimal):
-    print("\n\n\nOptimal Locations for New Stores:")
-    opened_stores = [j for j in model.P if pyo.value(model.x[j]) > 0.5]
-    for store in opened_stores:
-        print(f"{store}")
\ No newline at end of file
+# The idea here is that w is a score for each potential store that tells us how many new customers will be gained by opening it
+def compute_weights(h_arr, d_arr):
+    # h[i,s] doesnt depend on j, so sum over the segments first and then weight by inverse distance
+    # w[k] = sum over i,s of h[i,s] / d[i,j] for the k-th potential store, which is one matrix-vector product
+    H_i = h_arr.sum(axis=1)
+    if d_arr.size >= NUMBA_MIN_SIZE:
+        kernel = _numba_weights_kernel()
+        if kernel is not None:
+            return kernel(H_i, d_arr)
+    inv_d = 1.0 / d_arr
+    return H_i @ inv_d
+
+
+# Picks the P_max stores with the largest weights, best store first
+def pick_top_stores(w, stores, P_max):
+    # Pick the P_max largest weights without sorting everything, then only sort those few so the best store prints first
+    if P_max <= 0:
+        return []
+    if P_max >= len(w):
+        top = np.arange(len(w))
+    else:
+        top = np.argpartition(w, -P_max)[-P_max:]
+    top = top[np.argsort(-w[top])]
+    return [stores[k] for k in top]
+
+
+def build_model(data, w, P_max):
+    # Create a concrete PyOmo model instance
+    model = pyo.ConcreteModel(name="Retail_Store_Location")
+
+    # Categories in the data
+    # Only P's order matters (it lines up with w), the rest skip pyomo's order bookkeeping
+    model.I = pyo.Set(initialize=tuple(data['customer_demand']), ordered=False)
+    model.J = pyo.Set(initialize=tuple(data['potential_new_stores']), ordered=False)
+    model.S = pyo.Set(initialize=tuple(data['demographics']), ordered=False)
+    model.E = pyo.Set(initialize=tuple(data['existing_stores']), ordered=False)
+    model.C = pyo.Set(initialize=tuple(data['competitor_stores']), ordered=False)
+    model.P = pyo.Set(initialize=tuple(data['potential_new_locations']))
+
+    # Category data
+    # h and d only feed the objective weights, so they stay as numpy arrays instead of Params
+    # mutable so it can be changed and re-solved without rebuilding the model (see solve_for_budgets)
+    model.P_max = pyo.Param(initialize=P_max, mutable=True, doc="Maximum number of new stores to open")
+
+    # Model is told to make decisions about new store locations using a binary system (1 = build store, 0 = dont build store)
+    model.x = pyo.Var(model.P, within=pyo.Binary)
+
+    def objective_rule(model):
+        # Simplified objective: Maximize the sum of demand captured by new stores, weighted by inverse distance.
+        # This linearizes the problem, allowing the use of a MILP solver like HiGHS.
+        # The demand/distance math is already done in w, so this is just one term per potential store
+        # Building the LinearExpression directly skips pyomo's operator overloading for every term
+        return LinearExpression(constant=0.0, linear_coefs=w.tolist(), linear_vars=[model.x[j] for j in model.P])
+    model.objective = pyo.Objective(rule=objective_rule, sense=pyo.maximize)
+
+    # Tells the model what the max number of binary values of 1 that we want -- Basically, how many new stores we want to open
+    def budget_constraint_rule(model):
+        total_new_stores = LinearExpression(constant=0.0, linear_coefs=[1.0] * len(model.P), linear_vars=[model.x[j] for j in model.P])
+        return total_new_stores <= model.P_max
+    model.budget_constraint = pyo.Constraint(rule=budget_constraint_rule)
+
+    return model
+
+
+# APPSI HiGHS hands the model to the solver in memory, so no LP file gets written like with GLPK
+# It's also persistent: solving the same model again with the same solver only sends over what changed
+def make_solver():
+    solver = Highs()
+    solver.config.stream_solver = True
+    # No readable names needed for the variables/constraints, and the solution is only loaded once we know it's optimal
+    solver.config.symbolic_solver_labels = False
+    solver.config.load_solution = False
+    return solver
+
+
+# Solves the model and returns the stores to open (empty if the solve wasnt optimal)
+# Pass in the solver from a previous solve to reuse its copy of the model instead of starting from scratch
+def solve_model(model, solver=None):
+    if solver is None:
+        solver = make_solver()
+    results = solver.solve(model)
+
+    if results.termination_condition != TerminationCondition.optimal:
+        return []
+    results.solution_loader.load_vars()
+    return [j for j in model.P if pyo.value(model.x[j]) > 0.5]
+
+
+# Re-solves the same model for each value of P_max, returns {P_max: stores to open}
+# Only the budget constraint changes between solves, so the solver instance is kept and just gets the new bound
+# (the objective weights can be tweaked the same way by replacing model.objective before the next solve)
+def solve_for_budgets(model, P_max_values):
+    solver = make_solver()
+    opened_stores = {}
+    for budget in P_max_values:
+        model.P_max.set_value(budget)
+        opened_stores[budget] = solve_model(model, solver)
+    return opened_stores
+
+
+def main():
+    data = load_data()
+    w = compute_weights(data['h'], data['d'])
+
+    if USE_SOLVER:
+        model = build_model(data, w, P_max)
+        print("PyOmo model has been built successfully.")
+        opened_stores = solve_model(model)
+    else:
+        opened_stores = pick_top_stores(w, data['potential_new_locations'], P_max)
+
+    if opened_stores:
+        print("\n\n\nOptimal Locations for New Stores:")
+        for store in opened_stores:
+            print(f"{store}")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,8 +15,10 @@ sheets_to_csv = {
     'V_j=0': 'RetailStores-V_j=0.csv',
 }
 
+# Parse the workbook once and pull every sheet out of it, instead of re-reading the file per sheet
+all_sheets = pd.read_excel(excel_file, sheet_name=list(sheets_to_csv.keys()))
 for sheet_name, csv_name in sheets_to_csv.items():
-    df = pd.read_excel(excel_file, sheet_name=sheet_name)
+    df = all_sheets[sheet_name]
     df.to_csv(os.path.join(output_dir, csv_name), index=False, header=True)
     print(f"Converted sheet '{sheet_name}' to '{csv_name}'")
 print("All specified sheets converted to CSV successfully")